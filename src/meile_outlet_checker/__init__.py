@@ -1,70 +1,428 @@
 import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from functools import partial
+from hashlib import blake2b, file_digest
+from http import HTTPStatus
 from io import StringIO
 from json import load
+from math import ceil
+from os import cpu_count
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from time import sleep
-from typing import Annotated, Optional
+from typing import Annotated, Iterable, Iterator, Mapping, NamedTuple, Optional
 
+from ahocorasick import Automaton
 from appdirs import user_cache_dir
-from fuzzysearch import find_near_matches
-from pydantic import BaseModel
-from pypdf import PdfReader
-from requests import get, post
+from pydantic import BaseModel, NonNegativeInt, model_validator
+from pypdfium2 import PdfDocument
+from rapidfuzz.distance import Levenshtein
+from requests import RequestException, post
 from rich.console import Console
-from schedule import every, run_pending
+from schedule import every, idle_seconds, run_pending
 from typer import Option, Typer
 
 from .utils import console as std_console
-from .utils import create_directory, package
+from .utils import create_directory, http_session, package, read_json, write_json
 
 app = Typer()
 
+PAGE_SEPARATOR = "\x00"
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+BATCHES_PER_WORKER = 4
+# response headers recorded alongside the PDF to detect unchanged downloads
+VALIDATOR_HEADERS = ("ETag", "Last-Modified")
+CACHED_HEADERS = (*VALIDATOR_HEADERS, "Content-Length")
+# deletes every character str.split() treats as whitespace, all of which are
+# below U+3001, in a single pass
+WHITESPACE_DELETIONS = str.maketrans(
+    "", "", "".join(c for c in map(chr, range(0x3001)) if c.isspace())
+)
+# extracted page text is cached by PDF hash; bump the version whenever the
+# normalisation changes so stale extractions are not reused
+TEXT_CACHE_DIR = "text"
+TEXT_CACHE_VERSION = 3
+TEXT_CACHE_ENTRIES = 3
+
+
+class CaseFoldTable(dict):
+    """Translation table that case-folds each character on its own, leaving it
+    unchanged where folding would produce several characters (e.g. "ß" -> "ss"), so
+    folded text stays aligned with the original"""
+
+    def __missing__(self, key: int) -> str:
+        folded = chr(key).casefold()
+        if len(folded) != 1:
+            folded = chr(key)
+        self[key] = folded
+        return folded
+
+
+CASE_FOLD = CaseFoldTable()
+
 
 class CodeInfo(BaseModel):
     code: str
     extra: str
+    max_l_dist: NonNegativeInt = 0
+
+    @model_validator(mode="after")
+    def check_max_l_dist(self) -> "CodeInfo":
+        if self.max_l_dist and self.max_l_dist >= len(normalize(self.code)):
+            raise ValueError("max_l_dist must be less than the length of code")
+        return self
 
 
 class Input(BaseModel):
     codes: list[CodeInfo]
 
 
+def normalize(text: str) -> str:
+    """Remove all whitespace from text, for whitespace-insensitive searching"""
+    return text.translate(WHITESPACE_DELETIONS)
+
+
+def fold(text: str) -> str:
+    """Case-fold text without changing its length, for case-insensitive searching"""
+    return text.translate(CASE_FOLD)
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    dist: int
+    matched: str
+
+
+def find_matches(
+    needles: list[str],
+    max_dists: list[int],
+    texts: Iterable[str],
+    stop_early: bool = False,
+) -> list[list[Match]]:
+    """Find occurrences of each needle in texts, within its maximum distance.
+
+    Matching ignores case, but matched text is reported as it appears in texts.
+    Needles with no allowed distance are all found by one automaton scan per text,
+    the rest are searched for individually. Empty needles never match. With
+    stop_early, no more texts are read once every needle has been found.
+
+    Returns a list of matches for each needle, in the same order as needles.
+    """
+    matches: list[list[Match]] = [[] for _ in needles]
+    needles = [fold(needle) for needle in needles]
+
+    # identical needles share a single entry in the automaton
+    indices_by_needle: dict[str, list[int]] = {}
+    for i, (needle, max_dist) in enumerate(zip(needles, max_dists)):
+        if needle and max_dist == 0:
+            indices_by_needle.setdefault(needle, []).append(i)
+
+    automaton = Automaton()
+    for needle, indices in indices_by_needle.items():
+        automaton.add_word(needle, indices)
+    automaton.make_automaton()
+
+    for text in texts:
+        folded = fold(text)
+        if indices_by_needle:
+            # the automaton reports overlapping occurrences, but only count those that
+            # start after the previous match of the same needle ended
+            last_end: dict[str, int] = {}
+            for last, indices in automaton.iter(folded):
+                needle = needles[indices[0]]
+                start = last - len(needle) + 1
+                if start < last_end.get(needle, 0):
+                    continue
+
+                last_end[needle] = last + 1
+                match = Match(start, last + 1, 0, text[start : last + 1])
+                for i in indices:
+                    matches[i].append(match)
+
+        for i, (needle, max_dist) in enumerate(zip(needles, max_dists)):
+            if needle and max_dist:
+                matches[i].extend(
+                    match._replace(matched=text[match.start : match.end])
+                    for match in fuzzy_find(needle, folded, max_dist)
+                )
+
+        if stop_early and all(
+            found for needle, found in zip(needles, matches) if needle
+        ):
+            break
+
+    return matches
+
+
+def could_match(needle: str, counts: Mapping[str, int], max_dist: int) -> bool:
+    """Check if text with these character counts could hold needle within max_dist"""
+    # every character the text is short of needs at least one edit
+    shortfall = sum(max(n - counts.get(c, 0), 0) for c, n in Counter(needle).items())
+    return shortfall <= max_dist
+
+
+def fuzzy_find(needle: str, haystack: str, max_dist: int) -> list[Match]:
+    """Find non-overlapping occurrences of needle in haystack within max_dist edits"""
+    if len(needle) <= max_dist:
+        raise ValueError("max_dist must be less than the length of needle")
+
+    # split the needle into max_dist + 1 pieces; any match has at most max_dist edits,
+    # so it contains at least one piece unchanged, and must start within max_dist of
+    # where that piece's exact occurrence puts it
+    bounds = [len(needle) * i // (max_dist + 1) for i in range(max_dist + 2)]
+    starts: set[int] = set()
+    for offset, piece_end in zip(bounds, bounds[1:]):
+        piece = needle[offset:piece_end]
+        hit = haystack.find(piece)
+        while hit != -1:
+            starts.update(
+                range(max(hit - offset - max_dist, 0), hit - offset + max_dist + 1)
+            )
+            hit = haystack.find(piece, hit + 1)
+
+    # find the closest window at each possible start, preferring windows the same
+    # length as the needle; the cutoff lets rapidfuzz give up on a window as soon
+    # as it is known to be too far away
+    lengths = sorted(
+        range(len(needle) - max_dist, len(needle) + max_dist + 1),
+        key=lambda length: abs(length - len(needle)),
+    )
+    candidates = []
+    for start in sorted(starts):
+        best = None
+        for length in lengths:
+            end = start + length
+            window = haystack[start:end]
+            if end > len(haystack) or PAGE_SEPARATOR in window:
+                continue  # matches never run off the end or span two pages
+
+            dist = Levenshtein.distance(needle, window, score_cutoff=max_dist)
+            if dist <= max_dist and (best is None or dist < best.dist):
+                best = Match(start, end, dist, window)
+
+        if best:
+            candidates.append(best)
+
+    # keep only the closest of each run of overlapping candidates
+    matches = []
+    for candidate in candidates:
+        if matches and candidate.start < matches[-1].end:
+            if candidate.dist < matches[-1].dist:
+                matches[-1] = candidate
+        else:
+            matches.append(candidate)
+
+    return matches
+
+
 def replace_if_different(new_file: Path, old_file: Path) -> bool:
     """Replace old_file with new_file if contents differ. Return True if replaced, False otherwise."""
     if not new_file.exists():
         std_console.print(f"New file {new_file} does not exist; cannot replace.")
         return False  # New file does not exist
 
-    if old_file.exists():
+    # only hash the files if the sizes match, since a size difference is conclusive
+    if old_file.exists() and new_file.stat().st_size == old_file.stat().st_size:
         with open(new_file, "rb") as f1, open(old_file, "rb") as f2:
-            if f1.read() == f2.read():
-                std_console.print("Files are identical; not replacing.")
-                return False  # Files are identical
+            new_digest = file_digest(f1, "blake2b").digest()
+            old_digest = file_digest(f2, "blake2b").digest()
+
+        if new_digest == old_digest:
+            std_console.print("Files are identical; not replacing.")
+            return False  # Files are identical
 
     shutil.move(new_file, old_file)
     return True
 
 
-def download_pdf(url: str, filename: str, dest: Path) -> tuple[bool, Path]:
-    std_console.print(f"Downloading PDF from {url}")
+def headers_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.headers.json")
+
+
+def load_cached_headers(path: Path) -> dict[str, str]:
+    """Load the response headers saved for a downloaded file, if it still exists"""
+    if not path.exists():
+        return {}
+
+    # a missing or damaged sidecar just means the file is downloaded again
+    cached = read_json(headers_path(path))
+    return cached if isinstance(cached, dict) else {}
 
-    response = get(url, timeout=10)
-    response.raise_for_status()
 
+def save_cached_headers(path: Path, headers: Mapping[str, str]) -> None:
+    cached = {name: headers[name] for name in CACHED_HEADERS if name in headers}
+    write_json(headers_path(path), cached)
+
+
+def is_unchanged(cached: Mapping[str, str], headers: Mapping[str, str]) -> bool:
+    """Check whether response headers show the file is the same as the cached one"""
+    compared = [name for name in CACHED_HEADERS if name in cached and name in headers]
+    if not any(name in VALIDATOR_HEADERS for name in compared):
+        return False  # Content-Length alone can't show the file is unchanged
+
+    return all(cached[name] == headers[name] for name in compared)
+
+
+def download_pdf(url: str, filename: str, dest: Path) -> tuple[bool, Path]:
     final_path = dest / filename
-    with TemporaryDirectory() as tmpdir:
+    session = http_session()
+
+    cached = load_cached_headers(final_path)
+    if any(name in cached for name in VALIDATOR_HEADERS):
+        # a failed HEAD is not fatal; the conditional GET below still avoids
+        # downloading an unchanged file if the server supports it
+        try:
+            response = session.head(url, timeout=(5, 30), allow_redirects=True)
+            response.raise_for_status()
+        except RequestException as e:
+            std_console.print(f"HEAD request failed ({e}); trying download.")
+        else:
+            if is_unchanged(cached, response.headers):
+                std_console.print("Server reports PDF is unchanged; not downloading.")
+                return False, final_path
+
+    conditional_headers = {}
+    if "ETag" in cached:
+        conditional_headers["If-None-Match"] = cached["ETag"]
+    if "Last-Modified" in cached:
+        conditional_headers["If-Modified-Since"] = cached["Last-Modified"]
+
+    std_console.print(f"Downloading PDF from {url}")
+    with (
+        TemporaryDirectory() as tmpdir,
+        session.get(
+            url, headers=conditional_headers, timeout=(5, 30), stream=True
+        ) as response,
+    ):
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            std_console.print("Server reports PDF is unchanged; not downloading.")
+            return False, final_path
+
+        response.raise_for_status()
+        # let urllib3 undo any gzip/deflate transfer encoding while we copy
+        response.raw.decode_content = True
+
         tmp_path = Path(tmpdir) / filename
         with open(tmp_path, "wb") as f:
-            f.write(response.content)
+            shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
             std_console.print(f"Saved PDF to {tmp_path}")
 
         replaced = replace_if_different(new_file=tmp_path, old_file=(dest / filename))
+        save_cached_headers(final_path, response.headers)
 
     return replaced, final_path
 
 
+def extract_normalized_pages(path: str, page_indices: range) -> list[str]:
+    """Extract the text of a run of PDF pages, with all whitespace removed"""
+    pdf = PdfDocument(path)
+    try:
+        texts = [pdf[i].get_textpage().get_text_range() for i in page_indices]
+    finally:
+        pdf.close()
+
+    return [normalize(text) for text in texts]
+
+
+def split_pages(num_pages: int, num_batches: int) -> list[range]:
+    """Split page indices into at most num_batches contiguous runs"""
+    batch_size = max(ceil(num_pages / max(num_batches, 1)), 1)
+    return [
+        range(start, min(start + batch_size, num_pages))
+        for start in range(0, num_pages, batch_size)
+    ]
+
+
+def iter_normalized_pages(path: Path) -> Iterator[str]:
+    """Extract the normalised text of each page of a PDF, yielding pages in order"""
+    pdf = PdfDocument(path)
+    try:
+        num_pages = len(pdf)
+    finally:
+        pdf.close()
+
+    # spread the pages over all available cores; PDFium objects can't be shared
+    # between processes, so each worker opens the document once per run of pages.
+    # Several runs per worker let the earliest pages arrive sooner, and the runs not
+    # yet started are cancelled if iteration stops early
+    workers = cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        batches = split_pages(num_pages, workers * BATCHES_PER_WORKER)
+        for pages in executor.map(
+            partial(extract_normalized_pages, str(path)), batches
+        ):
+            yield from pages
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def text_cache_file(path: Path, cache_dir: Path) -> Path:
+    """Get the cache file for the extracted text of a PDF, named by its contents"""
+    with open(path, "rb") as f:
+        digest = file_digest(f, lambda: blake2b(digest_size=16)).hexdigest()
+
+    return cache_dir / f"{digest}.v{TEXT_CACHE_VERSION}.json"
+
+
+def read_text_cache(cache_file: Path) -> Optional[list[str]]:
+    """Read cached page text, or None if it is missing or unreadable"""
+    normalized_pages = read_json(cache_file)
+    if not isinstance(normalized_pages, list):
+        return None
+
+    # mark the entry as recently used, so pruning keeps it
+    cache_file.touch()
+    return normalized_pages
+
+
+def write_text_cache(cache_file: Path, normalized_pages: list[str]) -> None:
+    """Write cached page text, keeping only the most recently used entries"""
+    create_directory(cache_file.parent)
+    write_json(cache_file, normalized_pages)
+
+    # a new PDF is only parsed once its bytes differ from the last one, so the cache
+    # only helps when the server goes back to a recent version; older entries are
+    # just clutter
+    entries = sorted(
+        cache_file.parent.glob("*.json"),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in entries[TEXT_CACHE_ENTRIES:]:
+        entry.unlink(missing_ok=True)
+
+
+def stream_normalized_pages(path: Path, cache_dir: Path) -> Iterator[str]:
+    """Yield the normalised page text of a PDF, reusing any cached extraction.
+
+    Pages not in the cache are extracted as they are iterated over, and cached once
+    every page has been read.
+    """
+    cache_file = text_cache_file(path, cache_dir)
+    cached_pages = read_text_cache(cache_file)
+    if cached_pages is not None:
+        std_console.print(f"Using cached text from {cache_file}")
+        yield from cached_pages
+        return
+
+    normalized_pages = []
+    with closing(iter_normalized_pages(path)) as pages:
+        for page in pages:
+            normalized_pages.append(page)
+            yield page
+
+    write_text_cache(cache_file, normalized_pages)
+
+
+def load_normalized_pages(path: Path, cache_dir: Path) -> list[str]:
+    """Extract the normalised page text of a PDF, reusing any cached extraction"""
+    return list(stream_normalized_pages(path, cache_dir))
+
+
 def send_signal_message(
     message: str,
     number: str,
@@ -86,6 +444,7 @@ def parse_and_notify_pdf(
     directory: Path,
     file: str,
     input_data: Input,
+    stop_early: bool = False,
 ):
     std_console.print(f"Using directory: {directory}")
     create_directory(directory)
@@ -112,36 +471,53 @@ def parse_and_notify_pdf(
         else:
             std_console.print("New file downloaded.")
 
-    # open the pdf file
-    std_console.print(f"Parsing PDF at {old_file}")
-    reader = PdfReader(old_file)
-
-    # get number of pages
-    num_pages = len(reader.pages)
     buffer = StringIO()
 
     console = Console(file=buffer)
-    std_console.print(f"Number of pages: {num_pages}")
-    # define key terms
 
-    found_matches = False
-    # for s in string or []:
-    for code_info in input_data.codes:
-        # extract text and do the search
-        matches = []
-        for page in reader.pages:
-            text = page.extract_text()
-            text = "".join(text.split())
-
-            matches.extend(
-                find_near_matches(
-                    "".join(code_info.code.split()),
-                    text,
-                    max_l_dist=0,
-                )
-            )
+    codes = [normalize(code_info.code) for code_info in input_data.codes]
+    max_dists = [code_info.max_l_dist for code_info in input_data.codes]
+
+    # extract and normalise each page once, rather than once per code
+    std_console.print(f"Parsing PDF at {old_file}")
+    cache_dir = directory / TEXT_CACHE_DIR
+
+    if stop_early:
+        # search page by page, so later pages are never extracted once every code
+        # has been found
+        with closing(stream_normalized_pages(old_file, cache_dir)) as pages:
+            matches_by_code = find_matches(codes, max_dists, pages, stop_early=True)
+    else:
+        normalized_pages = load_normalized_pages(old_file, cache_dir)
+        std_console.print(f"Number of pages: {len(normalized_pages)}")
+
+        # join the pages so the whole document is searched in one pass; normalised
+        # codes never contain the separator, so no match can span two pages
+        document = PAGE_SEPARATOR.join(normalized_pages)
+
+        # skip fuzzy codes whose characters don't all appear in the document often
+        # enough; exact codes share a single scan, so skipping them saves nothing
+        if any(max_dists):
+            document_counts: Counter[str] = Counter()
+            for c, n in Counter(document).items():
+                document_counts[fold(c)] += n
+            codes = [
+                code
+                if not max_dist or could_match(fold(code), document_counts, max_dist)
+                else ""
+                for code, max_dist in zip(codes, max_dists)
+            ]
+
+        matches_by_code = find_matches(codes, max_dists, [document])
 
-        if matches:
+    found_matches = False
+    for code_info, matches in zip(input_data.codes, matches_by_code):
+        if matches and stop_early:
+            # the search stopped early, so the matches found may not be all of them
+            found_matches = True
+            console.print(f"Found '{code_info.code}'")
+            console.print(f"{code_info.extra}")
+        elif matches:
             found_matches = True
             console.print(f"Found {len(matches)} matches for '{code_info.code}'")
             console.print(f"{code_info.extra}:")
@@ -211,7 +587,12 @@ def default(
             exists=True,
         ),
     ] = Path("input.json"),
-    once: Annotated[bool, Option(help="Run once and exit")] = False,
+    once: Annotated[
+        bool,
+        Option(
+            help="Run once and exit, reading the PDF only until every code is found"
+        ),
+    ] = False,
 ) -> None:
     input_data = load_input_from_json(input_file)
 
@@ -224,6 +605,7 @@ def default(
             directory=directory,
             file=file,
             input_data=input_data,
+            stop_early=True,
         )
         return
 
@@ -241,7 +623,8 @@ def default(
     )
     while True:
         run_pending()
-        sleep(1)
+        # sleep until the next job is due, rather than waking up every second
+        sleep(max(idle_seconds() or 0, 0))
 
 
 def main() -> None:
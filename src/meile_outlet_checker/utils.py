@@ -2,11 +2,15 @@
 
 from functools import cache, partial
 from importlib.metadata import version as _version
+from json import JSONDecodeError, dump, load
 from logging import Formatter, getLogger
+from os import replace
 from pathlib import Path
 from sys import maxsize
-from typing import Optional
+from typing import Any, Optional
 
+from requests import Session
+from requests.adapters import HTTPAdapter, Retry
 from rich.console import Console
 from rich.logging import RichHandler
 
@@ -40,11 +44,42 @@ def create_basic_logger(
     logger.addHandler(handler)
 
 
+@cache
+def http_session() -> Session:
+    """Get a shared HTTP session, so connections are kept alive between requests"""
+    session = Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=1),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def create_directory(path: Path) -> None:
     """Create a directory if it doesn't exist already"""
     path.mkdir(parents=True, exist_ok=True)
 
 
+def read_json(path: Path) -> Any:
+    """Read a JSON file, returning None if it is missing or unreadable"""
+    try:
+        with uopen(path, "r") as f:
+            return load(f)
+    except (OSError, JSONDecodeError):
+        return None
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Write a JSON file via a temporary file, so it is never left half-written"""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with uopen(tmp_path, "w") as f:
+        dump(data, f)
+    replace(tmp_path, path)
+
+
 uopen = partial(open, encoding="UTF-8")
 err_console = Console(stderr=True, style="red")
 console = Console(stderr=False)
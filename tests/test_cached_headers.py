@@ -0,0 +1,53 @@
+from meile_outlet_checker import (
+    headers_path,
+    is_unchanged,
+    load_cached_headers,
+    save_cached_headers,
+)
+
+
+def test_unchanged_when_validators_match():
+    cached = {"ETag": '"v1"', "Content-Length": "900"}
+    assert is_unchanged(cached, {"ETag": '"v1"', "Content-Length": "900"})
+
+
+def test_changed_when_a_validator_differs():
+    assert not is_unchanged({"ETag": '"v1"'}, {"ETag": '"v2"'})
+
+
+def test_changed_when_length_differs_despite_matching_validator():
+    modified = "Mon, 01 Sep 2025 09:00:00 GMT"
+    cached = {"Last-Modified": modified, "Content-Length": "900"}
+    headers = {"Last-Modified": modified, "Content-Length": "901"}
+    assert not is_unchanged(cached, headers)
+
+
+def test_length_alone_never_shows_unchanged():
+    assert not is_unchanged({"Content-Length": "900"}, {"Content-Length": "900"})
+
+
+def test_changed_when_server_sends_no_shared_validator():
+    assert not is_unchanged({"ETag": '"v1"'}, {"Last-Modified": "yesterday"})
+
+
+def test_headers_round_trip(tmp_path):
+    pdf = tmp_path / "file.pdf"
+    pdf.write_bytes(b"%PDF")
+    save_cached_headers(pdf, {"ETag": '"v1"', "Content-Type": "application/pdf"})
+
+    assert load_cached_headers(pdf) == {"ETag": '"v1"'}
+
+
+def test_headers_ignored_when_file_is_missing(tmp_path):
+    pdf = tmp_path / "file.pdf"
+    headers_path(pdf).write_text('{"ETag": "\\"v1\\""}')
+
+    assert load_cached_headers(pdf) == {}
+
+
+def test_truncated_headers_are_ignored(tmp_path):
+    pdf = tmp_path / "file.pdf"
+    pdf.write_bytes(b"%PDF")
+    headers_path(pdf).write_text('{"ETa')
+
+    assert load_cached_headers(pdf) == {}
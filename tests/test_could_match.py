@@ -0,0 +1,25 @@
+from collections import Counter
+
+from meile_outlet_checker import could_match
+
+
+def test_possible_when_every_character_is_present():
+    assert could_match("abba", Counter("xxaabbb"), 0)
+
+
+def test_impossible_when_a_character_is_missing():
+    assert not could_match("abc", Counter("aabb"), 0)
+
+
+def test_character_multiplicity_counts():
+    assert not could_match("aab", Counter("ab"), 0)
+
+
+def test_shortfall_within_max_dist_is_possible():
+    assert could_match("abcd", Counter("ab"), 2)
+    assert not could_match("abcd", Counter("ab"), 1)
+
+
+def test_repeated_shortfall_adds_up():
+    assert not could_match("aaaa", Counter("aa"), 1)
+    assert could_match("aaaa", Counter("aa"), 2)
@@ -0,0 +1,46 @@
+from meile_outlet_checker import Match, find_matches
+
+
+def test_overlapping_occurrences_are_not_counted():
+    assert find_matches(["aa"], [0], ["aaaa"]) == [
+        [Match(0, 2, 0, "aa"), Match(2, 4, 0, "aa")]
+    ]
+
+
+def test_identical_needles_match_case_insensitively():
+    match = Match(2, 5, 0, "AbC")
+    assert find_matches(["ABC", "abc"], [0, 0], ["xxAbC"]) == [[match], [match]]
+
+
+def test_fuzzy_matches_report_original_text():
+    assert find_matches(["abcdef"], [1], ["ABCXEF"]) == [[Match(0, 6, 1, "ABCXEF")]]
+
+
+def test_empty_needles_never_match():
+    assert find_matches(["", "b"], [0, 0], ["abc"]) == [[], [Match(1, 2, 0, "b")]]
+
+
+def test_matches_from_every_text_are_collected():
+    assert find_matches(["ab"], [0], ["xab", "abx"]) == [
+        [Match(1, 3, 0, "ab"), Match(0, 2, 0, "ab")]
+    ]
+
+
+def test_stop_early_reads_no_texts_after_all_needles_are_found():
+    read = []
+
+    def texts():
+        for text in ["a", "xb", "ab"]:
+            read.append(text)
+            yield text
+
+    matches = find_matches(["a", "b", ""], [0, 0, 0], texts(), stop_early=True)
+
+    assert read == ["a", "xb"]
+    assert matches == [[Match(0, 1, 0, "a")], [Match(1, 2, 0, "b")], []]
+
+
+def test_without_stop_early_every_text_is_read():
+    matches = find_matches(["a"], [0], iter(["a", "a"]))
+
+    assert matches == [[Match(0, 1, 0, "a"), Match(0, 1, 0, "a")]]
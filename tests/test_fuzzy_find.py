@@ -0,0 +1,106 @@
+from random import Random
+
+import pytest
+from rapidfuzz.distance import Levenshtein
+
+from meile_outlet_checker import PAGE_SEPARATOR, Match, fuzzy_find
+
+
+def test_exact_occurrence_absorbs_overlapping_near_matches():
+    assert fuzzy_find("wwd164wcs", "xxwwd164wcsxx", 1) == [
+        Match(2, 11, 0, "wwd164wcs")
+    ]
+
+
+def test_closer_overlapping_candidate_replaces_earlier_one():
+    # "zabcdef" at 0 is within 1 edit, but the exact match at 1 overlaps it
+    assert fuzzy_find("abcdef", "zabcdef", 2) == [Match(1, 7, 0, "abcdef")]
+
+
+def test_separate_occurrences_are_all_kept():
+    assert fuzzy_find("wwd164wcs", "wwd164wcs--wwd164wcx", 1) == [
+        Match(0, 9, 0, "wwd164wcs"),
+        Match(11, 20, 1, "wwd164wcx"),
+    ]
+
+
+def test_prefers_window_of_needle_length():
+    assert fuzzy_find("abcdef", "abcxef", 1) == [Match(0, 6, 1, "abcxef")]
+
+
+def test_matches_do_not_span_pages():
+    assert fuzzy_find("abcdef", f"abc{PAGE_SEPARATOR}def", 1) == []
+
+
+def test_max_dist_must_be_less_than_needle_length():
+    with pytest.raises(ValueError):
+        fuzzy_find("ab", "abab", 2)
+
+
+def brute_force_fuzzy_find(needle: str, haystack: str, max_dist: int) -> list[Match]:
+    """Reference search trying every window at every start, with no prefiltering"""
+    lengths = sorted(
+        range(len(needle) - max_dist, len(needle) + max_dist + 1),
+        key=lambda length: abs(length - len(needle)),
+    )
+    candidates = []
+    for start in range(len(haystack)):
+        windows = [
+            (Levenshtein.distance(needle, haystack[start : start + length]), length)
+            for length in lengths
+            if start + length <= len(haystack)
+            and PAGE_SEPARATOR not in haystack[start : start + length]
+        ]
+        close = [(dist, length) for dist, length in windows if dist <= max_dist]
+        if close:
+            # min() keeps the first of equal distances, i.e. the nearest length
+            dist, length = min(close, key=lambda window: window[0])
+            end = start + length
+            candidates.append(Match(start, end, dist, haystack[start:end]))
+
+    matches: list[Match] = []
+    for candidate in candidates:
+        if matches and candidate.start < matches[-1].end:
+            if candidate.dist < matches[-1].dist:
+                matches[-1] = candidate
+        else:
+            matches.append(candidate)
+    return matches
+
+
+def random_case(rng: Random) -> tuple[str, str, int]:
+    alphabet = rng.choice(["ab", "abc", "abcd"])
+    haystack = "".join(
+        rng.choice(alphabet + PAGE_SEPARATOR) for _ in range(rng.randint(0, 50))
+    )
+    max_dist = rng.randint(1, 3)
+    needle = "".join(
+        rng.choice(alphabet) for _ in range(rng.randint(max_dist + 1, 8))
+    )
+    return needle, haystack, max_dist
+
+
+def test_random_matches_are_close_and_do_not_overlap():
+    rng = Random(0)
+    for _ in range(500):
+        needle, haystack, max_dist = random_case(rng)
+
+        matches = fuzzy_find(needle, haystack, max_dist)
+
+        for match in matches:
+            assert match.matched == haystack[match.start : match.end]
+            assert match.dist == Levenshtein.distance(needle, match.matched)
+            assert match.dist <= max_dist
+        for earlier, later in zip(matches, matches[1:]):
+            assert earlier.end <= later.start
+
+
+def test_random_matches_agree_with_brute_force():
+    # the needle-piece prefilter must never drop a match the full search finds
+    rng = Random(1)
+    for _ in range(2000):
+        needle, haystack, max_dist = random_case(rng)
+
+        assert fuzzy_find(needle, haystack, max_dist) == brute_force_fuzzy_find(
+            needle, haystack, max_dist
+        ), (needle, haystack, max_dist)
@@ -0,0 +1,31 @@
+from json import dumps
+from os import utime
+
+from meile_outlet_checker import TEXT_CACHE_ENTRIES, read_text_cache, write_text_cache
+
+
+def test_cache_round_trip(tmp_path):
+    write_text_cache(tmp_path / "a.json", ["page one", "page two"])
+
+    assert read_text_cache(tmp_path / "a.json") == ["page one", "page two"]
+
+
+def test_damaged_cache_is_a_miss(tmp_path):
+    (tmp_path / "a.json").write_text('["page')
+
+    assert read_text_cache(tmp_path / "a.json") is None
+
+
+def test_keeps_only_most_recently_used_entries(tmp_path):
+    # a full cache, oldest entry first
+    names = [f"{i}.json" for i in range(TEXT_CACHE_ENTRIES)]
+    for age, name in enumerate(names):
+        (tmp_path / name).write_text(dumps([name]))
+        utime(tmp_path / name, (1000 + age, 1000 + age))
+
+    # reading the oldest entry makes it the most recently used
+    assert read_text_cache(tmp_path / names[0]) == [names[0]]
+    write_text_cache(tmp_path / "new.json", ["new"])
+
+    remaining = {entry.name for entry in tmp_path.glob("*.json")}
+    assert remaining == {"new.json", names[0], *names[2:]}